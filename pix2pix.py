@@ -35,6 +35,8 @@ from tensorflow.keras.layers import BatchNormalization
 from matplotlib import pyplot as plt
 from tensorflow.keras.utils import plot_model
 
+from datasets import dequantize
+
 
    
 """
@@ -226,12 +228,23 @@ def define_gan(g_model, d_model, image_shape):
 
 # select a batch of random samples, returns images and target
 def generate_real_samples(dataset, n_samples, patch_shape):
+	# streaming pipelines hand an endless iterator of (input, target) slice
+	# pairs instead of in-memory arrays
+	if not isinstance(dataset, (list, tuple)):
+		pairs = [next(dataset) for _ in range(n_samples)]
+		X1 = np.stack([np.asarray(a) for a, b in pairs])
+		X2 = np.stack([np.asarray(b) for a, b in pairs])
+		y = ones((n_samples, patch_shape, patch_shape, 1))
+		return [X1, X2], y
 	# unpack dataset
 	trainA, trainB = dataset
 	# choose random instances
 	ix = randint(0, trainA.shape[0], n_samples)
 	# retrieve selected images
 	X1, X2 = trainA[ix], trainB[ix]
+	# int16-quantized datasets are upconverted lazily, one batch at a time
+	X1 = dequantize(X1)
+	X2 = dequantize(X2)
 	# generate 'real' class labels (1)
 	y = ones((n_samples, patch_shape, patch_shape, 1))
 	return [X1, X2], y
@@ -311,9 +324,14 @@ def train(d_model, g_model, gan_model, dataset, n_epochs=100, n_batch=1):
 	# determine the output square shape of the discriminator
 	n_patch = d_model.output_shape[1]
 	# unpack dataset
-	trainA, trainB = dataset
-	# calculate the number of batches per training epoch
-	bat_per_epo = int(len(trainA) / n_batch)
+	if isinstance(dataset, (list, tuple)):
+		trainA, trainB = dataset
+		# calculate the number of batches per training epoch
+		bat_per_epo = int(len(trainA) / n_batch)
+	else:
+		# tf.data pipeline from datasets.stream_dataset: slices stream on
+		# demand, so draw batches from an endless iterator instead
+		dataset = iter(dataset.repeat())
 	# calculate the number of training iterations
 	n_steps = 900 * n_epochs
 	# setup progress bar